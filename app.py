@@ -1,89 +1,285 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from scraper.crawler import crawl_website
 from scraper.generator import generate_llms_txt, generate_md_files, remove_md_extensions
 import os
-import json
-import traceback
 import re
 import bcrypt
+import orjson
 import jwt
 import datetime
 import secrets
-from pymongo import MongoClient
+import hashlib
+import hmac
+import functools
+from pymongo import MongoClient, ReturnDocument, UpdateOne, ASCENDING, DESCENDING
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
 from bson.objectid import ObjectId
 import smtplib
+import threading
+import atexit
+import queue
+import time
+import logging
+from logging.handlers import QueueHandler, QueueListener
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from html import escape as html_escape
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cachetools import TTLCache
+
+try:
+    from gevent import monkey as gevent_monkey, get_hub as gevent_get_hub
+except ImportError:
+    gevent_monkey = None
+
+# Log through a queue so request threads never block on writing to stdout;
+# set LOG_LEVEL=DEBUG to see per-URL scrape progress
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+    handlers=[QueueHandler(_log_queue)]
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger(__name__)
+
+class OrjsonProvider(JSONProvider):
+    """Serialize JSON responses with orjson, which writes bytes directly"""
+    
+    # ObjectId and other unknown types fall back to their string form
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS),
+            mimetype='application/json'
+        )
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, 
      resources={r"/api/*": {"origins": ["https://llmstxt-nextjs.vercel.app"]}},
      supports_credentials=True)  # Important for sending cookies cross-origin
 
+# Set once a unique index on users.email is known to exist. Until then
+# register() checks for an existing user itself instead of relying on
+# DuplicateKeyError.
+email_index_ready = False
+
 # MongoDB connection - replace the current code with this
 try:
     MONGODB_URI = os.environ.get("MONGODB_URI")
     JWT_SECRET = os.environ.get("JWT_SECRET", "default_secret")
     
-
-    print(f"Connecting to MongoDB with URI: {MONGODB_URI[:20]}..." if MONGODB_URI else "MongoDB URI not found")
-    print("MONGODB_URI:", repr(MONGODB_URI))
-    print("ENV VARS:")
-    print(os.environ)
-
-
+    if MONGODB_URI:
+        logger.info("Connecting to MongoDB")
+    else:
+        logger.warning("MongoDB URI not found")
+    
     if not MONGODB_URI or "localhost" in MONGODB_URI:
         raise ValueError("Invalid MongoDB URI. Please set a valid MONGODB_URI environment variable.")
     
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=30000)
+    client = MongoClient(
+        MONGODB_URI,
+        serverSelectionTimeoutMS=30000,
+        # Size the pool for gevent workers and keep a few sockets warm so
+        # the first requests don't pay for TCP+TLS handshakes. Both are
+        # per worker process, so scale them down when running many workers.
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 200)),
+        minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 20)),
+        waitQueueTimeoutMS=2000,
+        # Recycle sockets idle for 5 minutes before load balancers drop them
+        maxIdleTimeMS=300000,
+        connectTimeoutMS=5000,
+        socketTimeoutMS=15000,
+        retryWrites=True,
+        # Wire compression (zlib ships with Python, no extra dependency)
+        compressors='zlib'
+    )
     # Force a connection to verify it works
     client.admin.command('ping')
-    print("MongoDB connection successful!")
+    logger.info("MongoDB connection successful!")
     db = client.llms_txt_generator
     
-    # Check if we can access collections
-    db.users.find_one({})  # Just to test connection with a simple query
-    print("Successfully accessed users collection")
+    # Make sure the lookups every auth endpoint does are index hits.
+    # create_index is idempotent, so this is cheap on every start.
+    try:
+        db.users.create_index([("email", ASCENDING)], unique=True)
+        email_index_ready = True
+    except Exception as e:
+        logger.warning("Failed to create unique email index, registration will check for duplicates itself: %s", e)
+    try:
+        db.usage_logs.create_index([("userId", ASCENDING), ("timestamp", DESCENDING)])
+    except Exception as e:
+        logger.warning("Failed to create usage_logs index: %s", e)
     
 except Exception as e:
-    print(f"MongoDB connection error: {str(e)}")
-    print("Falling back to in-memory storage")
+    logger.error("MongoDB connection error: %s", e)
+    logger.warning("Falling back to in-memory storage")
     
     # Create in-memory storage as fallback
     class MemoryDB:
         def __init__(self):
             self.users = MemoryCollection("users")
             self.usage_logs = MemoryCollection("usage_logs")
+            
+            # Mirror the unique email index used in MongoDB
+            self.users.create_index([("email", ASCENDING)], unique=True)
+        
+        def get_collection(self, name, **kwargs):
+            # Write concerns mean nothing in memory
+            return getattr(self, name)
     
     class MemoryCollection:
         def __init__(self, name):
             self.name = name
-            self.data = []
-            self.id_counter = 1
+            self.data = {}  # _id -> document
+            self._indexes = {}  # field -> {value: document}, for unique fields
+        
+        def create_index(self, keys, unique=False, **kwargs):
+            # Only unique single-field indexes are kept: each value maps to
+            # exactly one document, giving O(1) equality lookups
+            if unique and len(keys) == 1:
+                field = keys[0][0]
+                self._indexes[field] = {doc[field]: doc for doc in self.data.values() if field in doc}
         
         def insert_one(self, doc):
-            # Add _id if not present
+            # Enforce unique indexes like MongoDB would
+            for field, index in self._indexes.items():
+                if field in doc and doc[field] in index:
+                    raise DuplicateKeyError(f"Duplicate key for {field}: {doc[field]}")
+            
+            # Add _id if not present, the same way MongoDB would
             if '_id' not in doc:
-                doc['_id'] = self.id_counter
-                self.id_counter += 1
-            self.data.append(doc)
+                doc['_id'] = ObjectId()
+            self.data[doc['_id']] = doc
+            for field, index in self._indexes.items():
+                if field in doc:
+                    index[doc[field]] = doc
             return {'inserted_id': doc['_id']}
         
-        def find_one(self, query=None):
+        def insert_many(self, docs, ordered=True):
+            for doc in docs:
+                self.insert_one(doc)
+        
+        def bulk_write(self, requests, ordered=True):
+            # Only UpdateOne is used by the app, built as MemoryUpdateOne
+            # while this fallback is active
+            for req in requests:
+                self.update_one(req.filter, req.update, upsert=req.upsert)
+        
+        def _matches(self, doc, query):
+            for k, v in query.items():
+                if k not in doc:
+                    return False
+                # Support the comparison operators used by the app
+                if isinstance(v, dict):
+                    for op, operand in v.items():
+                        if op == '$gt' and not doc[k] > operand:
+                            return False
+                        if op == '$gte' and not doc[k] >= operand:
+                            return False
+                        if op == '$lt' and not doc[k] < operand:
+                            return False
+                        if op == '$lte' and not doc[k] <= operand:
+                            return False
+                elif doc[k] != v:
+                    return False
+            return True
+        
+        def _apply_update(self, doc, update):
+            old_values = {field: doc.get(field) for field in self._indexes}
+            
+            # Handle $set operator
+            if '$set' in update:
+                for k, v in update['$set'].items():
+                    doc[k] = v
+            
+            # Handle $unset operator
+            if '$unset' in update:
+                for k in update['$unset']:
+                    if k in doc:
+                        del doc[k]
+            
+            # Handle $inc operator
+            if '$inc' in update:
+                for k, v in update['$inc'].items():
+                    if k in doc:
+                        doc[k] += v
+                    else:
+                        doc[k] = v
+            
+            # Keep the indexes in sync
+            for field, index in self._indexes.items():
+                if doc.get(field) != old_values[field]:
+                    index.pop(old_values[field], None)
+                    if field in doc:
+                        index[doc[field]] = doc
+        
+        def _project(self, doc, projection):
+            # Mirror MongoDB projections so the fallback never hands back
+            # fields (password hash, OTP) that a real query would leave out
+            if doc is None or not projection:
+                return doc
+            include_id = projection.get('_id', 1)
+            if any(v for k, v in projection.items() if k != '_id'):
+                result = {k: doc[k] for k, v in projection.items() if v and k != '_id' and k in doc}
+            else:
+                result = {k: v for k, v in doc.items() if k not in projection}
+            if include_id and '_id' in doc:
+                result['_id'] = doc['_id']
+            else:
+                result.pop('_id', None)
+            return result
+        
+        def find_one(self, query=None, projection=None):
             if not query:
-                return self.data[0] if self.data else None
+                return self._project(next(iter(self.data.values()), None), projection)
+            
+            # Primary key lookups hit the _id map directly
+            if '_id' in query and not isinstance(query['_id'], dict):
+                doc = self.data.get(query['_id'])
+                return self._project(doc, projection) if doc and self._matches(doc, query) else None
+            
+            # Equality on an indexed field (e.g. email) skips the scan
+            for field, index in self._indexes.items():
+                value = query.get(field)
+                if value is not None and not isinstance(value, dict):
+                    doc = index.get(value)
+                    return self._project(doc, projection) if doc and self._matches(doc, query) else None
                 
-            for doc in self.data:
-                match = True
-                for k, v in query.items():
-                    if k not in doc or doc[k] != v:
-                        match = False
-                        break
-                if match:
-                    return doc
+            for doc in self.data.values():
+                if self._matches(doc, query):
+                    return self._project(doc, projection)
             return None
         
+        def count_documents(self, query, limit=0):
+            # Existence checks reuse find_one's _id/email fast paths
+            if limit == 1:
+                return 1 if self.find_one(query) else 0
+            return sum(1 for doc in self.data.values() if self._matches(doc, query))
+        
+        def find_one_and_update(self, query, update, projection=None, return_document=ReturnDocument.BEFORE):
+            doc = self.find_one(query)
+            if not doc:
+                return None
+            
+            before = dict(doc)
+            self._apply_update(doc, update)
+            return self._project(doc if return_document == ReturnDocument.AFTER else before, projection)
+        
         def update_one(self, query, update, upsert=False):
             # Find matching document
             doc = self.find_one(query)
@@ -104,82 +300,274 @@ except Exception as e:
             
             # If document found, update it
             if doc:
-                # Handle $set operator
-                if '$set' in update:
-                    for k, v in update['$set'].items():
-                        doc[k] = v
-                
-                # Handle $unset operator
-                if '$unset' in update:
-                    for k in update['$unset']:
-                        if k in doc:
-                            del doc[k]
-                
-                # Handle $inc operator
-                if '$inc' in update:
-                    for k, v in update['$inc'].items():
-                        if k in doc:
-                            doc[k] += v
-                        else:
-                            doc[k] = v
+                self._apply_update(doc, update)
+    
+    class MemoryUpdateOne:
+        """UpdateOne stand-in whose fields MemoryCollection.bulk_write can read"""
+        def __init__(self, filter, update, upsert=False):
+            self.filter = filter
+            self.update = update
+            self.upsert = upsert
+    
+    # pymongo's UpdateOne keeps its fields private, so code building bulk
+    # writes gets this stand-in instead while the in-memory store is active
+    UpdateOne = MemoryUpdateOne
     
     # Create in-memory database as fallback
     db = MemoryDB()
-    print("Using in-memory database for testing")
+    # MemoryDB enforces the unique email index itself
+    email_index_ready = True
+    logger.info("Using in-memory database for testing")
 
-# Function to send OTP email
-def send_otp_email(to_email, otp, name):
-    try:
+SMTP_TIMEOUT = 30  # seconds
+
+class SMTPConnectionPool:
+    """Keeps one open SMTP connection per thread and reuses it across sends"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._servers = []
+
+    def _connect(self):
         # Get email settings from environment variables
         email_host = os.environ.get('EMAIL_HOST', 'smtp-relay.brevo.com')
         email_port = int(os.environ.get('EMAIL_PORT', 587))
         email_secure = os.environ.get('EMAIL_SECURE', 'false').lower() == 'true'
         email_user = os.environ.get('EMAIL_USER')
         email_password = os.environ.get('EMAIL_PASSWORD')
-        email_from = os.environ.get('EMAIL_FROM', '"Immortal" <aarje2050@gmail.com>')
-        
-        # Create message
-        message = MIMEMultipart('alternative')
-        message['Subject'] = 'Your Verification Code for LLMs.txt Generator'
-        message['From'] = email_from
-        message['To'] = to_email
-        
-        # Create HTML content
-        html = f"""
+
+        # Connect to SMTP server. Connections are long lived, so bound every
+        # socket operation to stop a stalled server hanging an email worker
+        server = smtplib.SMTP(email_host, email_port, timeout=SMTP_TIMEOUT)
+        if email_secure:
+            server.starttls()
+
+        # Login once for the lifetime of the connection
+        if email_user and email_password:
+            server.login(email_user, email_password)
+
+        with self._lock:
+            self._servers.append(server)
+        self._local.server = server
+        return server
+
+    def _discard(self, server):
+        self._local.server = None
+        with self._lock:
+            if server in self._servers:
+                self._servers.remove(server)
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def get_server(self):
+        """Return a healthy connection for the current thread, reconnecting if needed"""
+        server = getattr(self._local, 'server', None)
+        if server is not None:
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(server)
+
+        return self._connect()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Send a message, reconnecting once if the server dropped the connection"""
+        server = self.get_server()
+        try:
+            return server.sendmail(from_addr, to_addrs, msg)
+        except smtplib.SMTPServerDisconnected:
+            self._discard(server)
+            return self._connect().sendmail(from_addr, to_addrs, msg)
+
+    def close_all(self):
+        """Politely close every pooled connection (registered with atexit)"""
+        with self._lock:
+            servers, self._servers = self._servers, []
+        for server in servers:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+smtp_pool = SMTPConnectionPool()
+atexit.register(smtp_pool.close_all)
+
+# Background workers for sending emails so SMTP never blocks a request
+_email_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='email')
+
+# OTP email body, pre-split around the two per-user values so a send only
+# joins a few strings instead of formatting the whole template
+_OTP_HTML_HEAD = """
         <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
             <h2>Verify your email address</h2>
-            <p>Hello {name},</p>
+            <p>Hello """
+_OTP_HTML_MIDDLE = """,</p>
             <p>Thank you for registering with LLMs.txt Generator. Please use the verification code below to complete your registration:</p>
             <div style="background-color: #f4f4f4; padding: 15px; text-align: center; font-size: 24px; letter-spacing: 5px; margin: 20px 0;">
-                <strong>{otp}</strong>
+                <strong>"""
+_OTP_HTML_TAIL = """</strong>
             </div>
             <p>This code will expire in 15 minutes.</p>
             <p>If you didn't request this verification, you can safely ignore this email.</p>
             <p>Best regards,<br>The LLMs.txt Generator Team</p>
         </div>
         """
+
+# Function to send OTP email
+def send_otp_email(to_email, otp, name):
+    try:
+        email_from = os.environ.get('EMAIL_FROM', '"Immortal" <aarje2050@gmail.com>')
         
-        # Attach HTML content
-        message.attach(MIMEText(html, 'html'))
+        # Create message
+        message = MIMEMultipart('alternative')
+        message['Subject'] = 'Your Verification Code for LLMs.txt Generator'
+        message['From'] = email_from
+        message['To'] = to_email
         
-        # Connect to SMTP server
-        server = smtplib.SMTP(email_host, email_port)
-        if email_secure:
-            server.starttls()
+        # Fill in the prebuilt template - only the name and code vary per send
+        html = ''.join((_OTP_HTML_HEAD, html_escape(name), _OTP_HTML_MIDDLE, otp, _OTP_HTML_TAIL))
         
-        # Login and send
-        if email_user and email_password:
-            server.login(email_user, email_password)
+        # Attach HTML content. Naming the charset up front skips MIMEText's
+        # ASCII trial encode of the whole body.
+        message.attach(MIMEText(html, 'html', 'utf-8'))
         
-        server.sendmail(email_from, to_email, message.as_string())
-        server.quit()
+        # Send over the pooled connection - no connect/STARTTLS/AUTH per email
+        smtp_pool.sendmail(email_from, to_email, message.as_string())
         
-        print(f"OTP email sent successfully to {to_email}")
+        logger.info("OTP email sent successfully to %s", to_email)
         return True
     except Exception as e:
-        print(f"Failed to send OTP email: {str(e)}")
+        logger.error("Failed to send OTP email to %s: %s", to_email, e)
         return False
 
+# Only fetch the fields the auth endpoints actually use - never ship the
+# password hash or OTP over the wire unless they are needed
+_PUBLIC_PROJECTION = {'name': 1, 'email': 1, 'verified': 1, 'plan': 1, 'usageCount': 1}
+_LOGIN_PROJECTION = {**_PUBLIC_PROJECTION, 'password': 1}
+
+# Public user data served by /api/auth/me, cached briefly per email since the
+# endpoint is hit on nearly every page view. Entries are dropped whenever the
+# user's usage count changes or they log out.
+USER_CACHE_TTL = 30  # seconds
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+def _user_object_id(user_id):
+    """Turn the string user id from a JWT `sub` back into an ObjectId, or None if malformed"""
+    return ObjectId(user_id) if ObjectId.is_valid(user_id) else None
+
+def get_cached_user_data(user_id):
+    """Return the public user data for `user_id`, or None if no such user"""
+    with _user_cache_lock:
+        user_data = _user_cache.get(user_id)
+    if user_data is not None:
+        return user_data
+    
+    # Primary key lookup - no secondary index hop
+    object_id = _user_object_id(user_id)
+    user = db.users.find_one({"_id": object_id}, _PUBLIC_PROJECTION) if object_id else None
+    if not user:
+        return None
+    
+    # Return user data without sensitive fields
+    user_data = {
+        'id': str(user['_id']),
+        'name': user['name'],
+        'email': user['email'],
+        'verified': user['verified'],
+        'plan': user.get('plan', 'free'),
+        'usageCount': user.get('usageCount', 0)
+    }
+    with _user_cache_lock:
+        _user_cache[user_id] = user_data
+    return user_data
+
+def invalidate_cached_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+# Usage events are buffered in memory and written in batches by a
+# background thread, so tracking never waits on MongoDB
+USAGE_FLUSH_INTERVAL = 0.5  # seconds
+# Flush early once this many events are buffered, so a burst can't build one
+# huge batch and bulk writes stay well under MongoDB's limits
+USAGE_BATCH_SIZE = 500
+_usage_queue = queue.Queue()
+
+def _write_usage_events(events):
+    """Write a batch of usage events with one round trip per collection"""
+    if not events:
+        return
+    
+    # Group the counter increments per user
+    counts = {}
+    for event in events:
+        counts[event['userId']] = counts.get(event['userId'], 0) + 1
+    
+    db.usage_logs.insert_many([
+        {
+            "userId": event['userId'],
+            "urls": event['urls'],
+            "timestamp": event['timestamp']
+        }
+        for event in events
+    ], ordered=False)
+    
+    db.users.bulk_write([
+        UpdateOne({"_id": user_id}, {"$inc": {"usageCount": count}})
+        for user_id, count in counts.items()
+    ], ordered=False)
+    
+    # Make /api/auth/me pick up the new usage counts
+    for user_id in counts:
+        invalidate_cached_user(str(user_id))
+
+def _drain_usage_queue(events, timeout):
+    """Collect queued usage events for up to `timeout` seconds or USAGE_BATCH_SIZE events"""
+    deadline = time.monotonic() + timeout
+    while len(events) < USAGE_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return events
+        try:
+            events.append(_usage_queue.get(timeout=remaining))
+        except queue.Empty:
+            return events
+    return events
+
+def _usage_writer():
+    while True:
+        # Block until there is something to write, then batch whatever
+        # else arrives within the flush window
+        events = _drain_usage_queue([_usage_queue.get()], USAGE_FLUSH_INTERVAL)
+        try:
+            _write_usage_events(events)
+        except Exception as e:
+            logger.exception("Failed to write usage events")
+
+def _flush_usage_on_exit():
+    events = []
+    while True:
+        try:
+            events.append(_usage_queue.get_nowait())
+        except queue.Empty:
+            break
+    try:
+        _write_usage_events(events)
+    except Exception as e:
+        logger.exception("Failed to write usage events")
+
+threading.Thread(target=_usage_writer, name='usage-writer', daemon=True).start()
+atexit.register(_flush_usage_on_exit)
+
+# URLs that already carry an http(s) scheme
+_SCHEME_RE = re.compile(r'^https?://')
+
 def clean_urls_in_content(content):
     """
     Final safety check to remove any .md extensions from URLs in content
@@ -190,74 +578,282 @@ def clean_urls_in_content(content):
     Returns:
         str: Cleaned content with no .md extensions in URLs
     """
-    # Pattern to match markdown links with .md extensions
-    pattern = r'\[(.*?)\]\((.*?)\.md([^\)]*)\)'
+    return remove_md_extensions(content)
+
+# bcrypt cost factor for new hashes (~65 ms per hash at 10 vs ~250 ms at 12).
+# Existing hashes keep working since the cost is stored in the hash itself.
+# Set BCRYPT_COST to trade signup/login latency against hardening.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_COST', 10))
+
+# bcrypt's C code releases the GIL, so real threads already hash on every
+# core in parallel - no process pool needed. It is pure CPU work, so more
+# threads than cores would only queue.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='bcrypt')
+
+def _run_in_threadpool(func, *args):
+    """Run CPU-heavy work off the request greenlet/thread and wait for the result"""
+    if gevent_monkey and gevent_monkey.is_module_patched('threading'):
+        # Patched threads are greenlets; use gevent's native thread pool so the
+        # hub keeps serving other requests while bcrypt runs
+        return gevent_get_hub().threadpool.apply(func, args)
+    return _bcrypt_pool.submit(func, *args).result()
+
+def hash_password(password):
+    """Hash a password with bcrypt without blocking other requests"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return _run_in_threadpool(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+# Recent successful password checks, so quick repeat logins skip the KDF.
+# Keys are an HMAC under the server secret of the stored hash and the
+# password, so the cache never holds anything usable as a password oracle,
+# and changing the password (new hash) misses automatically.
+PASSWORD_CACHE_TTL = 30  # seconds
+_password_cache = TTLCache(maxsize=5_000, ttl=PASSWORD_CACHE_TTL)
+_password_cache_lock = threading.Lock()
+
+def check_password(password, hashed_password):
+    """Check a password against its bcrypt hash without blocking other requests"""
+    key = hmac.new(JWT_SECRET.encode('utf-8'),
+                   hashed_password.encode('utf-8') + b'\0' + password.encode('utf-8'),
+                   hashlib.sha256).digest()
+    with _password_cache_lock:
+        if key in _password_cache:
+            return True
     
-    def replace_link(match):
-        link_text = match.group(1)
-        url = match.group(2)
-        extra = match.group(3) if match.group(3) else ""
+    valid = _run_in_threadpool(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+    
+    # Only successes are cached; wrong passwords always pay the full cost
+    if valid:
+        with _password_cache_lock:
+            _password_cache[key] = True
+    return valid
+
+JWT_ALGORITHM = 'HS256'
+
+# Lifetimes of OTP codes and auth tokens
+_OTP_TTL = datetime.timedelta(minutes=15)
+_JWT_TTL = datetime.timedelta(days=30)
+
+# Handle for the pending-signup/OTP writes. That state is short-lived and
+# recoverable (the user can register or verify again), so these writes are
+# acknowledged without waiting for the journal flush.
+_otp_users = db.get_collection('users', write_concern=WriteConcern(w=1, j=False))
+
+def create_auth_token(user, user_id):
+    """Create the JWT stored in the auth cookie"""
+    return jwt.encode({
+        'sub': user_id,
+        'email': user['email'],
+        'name': user['name'],
+        # Unix timestamp - pyjwt serialises ints without datetime conversion
+        'exp': int(time.time() + _JWT_TTL.total_seconds())
+    }, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+# Recently verified token payloads, keyed by a hash of the token so raw
+# tokens are never kept around in memory
+TOKEN_CACHE_TTL = 30  # seconds
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
+def _token_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+def decode_auth_token(token):
+    """
+    Verify an auth token, skipping the signature check for tokens seen recently
+    
+    Args:
+        token (str): JWT from the auth cookie
+        
+    Returns:
+        dict: Decoded token payload
+        
+    Raises:
+        jwt.ExpiredSignatureError: If the token has expired
+        jwt.InvalidTokenError: If the token is invalid
+    """
+    key = _token_cache_key(token)
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        with _token_cache_lock:
+            _token_cache[key] = payload
+    
+    # A cached payload was verified when first seen, but it can still expire,
+    # so entries never outlive the token's own exp
+    if payload['exp'] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    
+    return payload
+
+def require_auth(f):
+    """
+    Reject requests without a valid auth cookie, exposing the token payload as g.auth
+    
+    Args:
+        f (callable): View function that needs an authenticated user
+        
+    Returns:
+        callable: Wrapped view returning 401 when the token is missing or invalid
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        token = request.cookies.get('auth_token')
+        if not token:
+            return jsonify({"message": "Authentication required"}), 401
+        
+        try:
+            g.auth = decode_auth_token(token)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"message": "Token expired"}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({"message": "Invalid token"}), 401
+        
+        return f(*args, **kwargs)
+    return wrapper
+
+# Recent scrape results, so re-running the same URL (e.g. a user tweaking
+# options in the UI) doesn't redo the crawl and generation. Bulk results
+# carry every page's markdown, so the cache is bounded by the size of the
+# text it holds (in characters, close to bytes) rather than by entry count.
+SCRAPE_CACHE_TTL = 300  # seconds
+SCRAPE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def _scrape_result_size(result):
+    """Approximate size of a cached scrape result"""
+    size = len(result['llms_txt'])
+    for md_file in result['md_files'].values():
+        size += len(md_file['content'])
+    return size
+
+_scrape_cache = TTLCache(maxsize=SCRAPE_CACHE_MAX_BYTES, ttl=SCRAPE_CACHE_TTL, getsizeof=_scrape_result_size)
+_scrape_cache_lock = threading.Lock()
+
+# Upper bound on URLs processed concurrently within a single /api/scrape call
+SCRAPE_MAX_WORKERS = int(os.environ.get('SCRAPE_MAX_WORKERS', 16))
+
+# Upper bound on URLs accepted in a single /api/scrape call
+SCRAPE_MAX_URLS = int(os.environ.get('SCRAPE_MAX_URLS', 50))
+
+def _with_scheme(url):
+    """Prefix https:// to a submitted URL that has no http(s) scheme"""
+    if isinstance(url, str) and not _SCHEME_RE.match(url):
+        return 'https://' + url
+    return url
+
+def _process_one_url(url, bulk_mode, use_cache=True):
+    """
+    Crawl (optionally) and generate LLMs.txt and markdown files for one URL
+    
+    Args:
+        url (str): The URL submitted by the client
+        bulk_mode (bool): Whether to crawl the website for all URLs
+        use_cache (bool): Whether recent scrape/crawl results may be reused
         
-        # Make sure URL has https:// if needed
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
+    Returns:
+        tuple: (normalized URL, result dict for that URL)
+    """
+    try:
+        logger.debug("Processing URL: %s", url)
+        
+        # Clean the URL (ensure it has a scheme)
+        url = _with_scheme(url)
+        
+        cache_key = (url, bool(bulk_mode))
+        with _scrape_cache_lock:
+            cached = _scrape_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            logger.debug("Serving cached result for %s", url)
+            return url, cached
+        
+        # The homepage downloaded for LLMs.txt, reused for its markdown file
+        pages = {}
+        
+        # Only crawl if bulk mode is enabled, otherwise just use the single URL
+        if bulk_mode:
+            logger.debug("Bulk mode enabled - crawling website for all URLs")
+            # The LLMs.txt homepage fetch doesn't depend on the crawl, so
+            # run it alongside instead of after it
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                llms_txt_future = executor.submit(generate_llms_txt, url, pages)
+                discovered_urls = crawl_website(url, use_cache=use_cache)
+                llms_txt_content = llms_txt_future.result()
+        else:
+            logger.debug("Single URL mode - skipping crawl")
+            discovered_urls = [url]  # Just use the single URL provided
             
-        return f'[{link_text}]({url}{extra})'
+            # Generate LLMs.txt content
+            llms_txt_content = generate_llms_txt(url, pages)
+        
+        logger.debug("Working with %d URLs", len(discovered_urls))
+        
+        # Apply one final safety check to ensure there are no .md extensions
+        llms_txt_content = clean_urls_in_content(llms_txt_content)
+        
+        # Generate markdown files for each URL
+        md_files = generate_md_files(url, discovered_urls, pages)
+        
+        url_result = {
+            'status': 'success',
+            'llms_txt': llms_txt_content,
+            'md_files': md_files,
+            'discovered_urls': discovered_urls
+        }
+        
+        # Only successful results are cached; errors are retried next time.
+        # A result bigger than the whole cache is simply not kept.
+        if _scrape_result_size(url_result) <= SCRAPE_CACHE_MAX_BYTES:
+            with _scrape_cache_lock:
+                _scrape_cache[cache_key] = url_result
+        
+        return url, url_result
+    except Exception as e:
+        logger.exception("Error processing %s", url)
+        return url, {
+            'status': 'error',
+            'error': str(e)
+        }
+
+def _scrape_results(urls, bulk_mode, use_cache=True):
+    """Yield (url, result) pairs as each submitted URL finishes processing"""
+    # The response is keyed by URL, so repeated URLs would only be
+    # crawled twice for nothing. Compare them with the scheme added, so
+    # "example.com" and "https://example.com" count as the same URL.
+    urls = list(dict.fromkeys(_with_scheme(url) for url in urls))
     
-    # Replace all instances
-    return re.sub(pattern, replace_link, content)
+    # URLs are independent and network bound - process them concurrently,
+    # capped so we don't hammer target hosts
+    with ThreadPoolExecutor(max_workers=min(SCRAPE_MAX_WORKERS, len(urls))) as executor:
+        futures = [executor.submit(_process_one_url, url, bulk_mode, use_cache) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
 
 @app.route('/api/scrape', methods=['POST'])
 def scrape():
     data = request.json
     urls = data.get('urls', [])
     bulk_mode = data.get('bulkMode', False)  # Get bulk mode flag from request
+    use_cache = not data.get('noCache', False)  # Force a fresh crawl when set
     
     if not urls:
         return jsonify({"error": "No URLs provided"}), 400
     
-    result = {}
-    for url in urls:
-        try:
-            print(f"Processing URL: {url}")
-            
-            # Clean the URL (ensure it has a scheme)
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            
-            # Only crawl if bulk mode is enabled, otherwise just use the single URL
-            if bulk_mode:
-                print("Bulk mode enabled - crawling website for all URLs")
-                discovered_urls = crawl_website(url)
-            else:
-                print("Single URL mode - skipping crawl")
-                discovered_urls = [url]  # Just use the single URL provided
-            
-            print(f"Working with {len(discovered_urls)} URLs")
-            
-            # Generate LLMs.txt content
-            llms_txt_content = generate_llms_txt(url)
-            
-            # Apply one final safety check to ensure there are no .md extensions
-            llms_txt_content = clean_urls_in_content(llms_txt_content)
-            
-            # Generate markdown files for each URL
-            md_files = generate_md_files(url, discovered_urls)
-            
-            result[url] = {
-                'status': 'success',
-                'llms_txt': llms_txt_content,
-                'md_files': md_files,
-                'discovered_urls': discovered_urls
-            }
-        except Exception as e:
-            print(f"Error processing {url}: {str(e)}")
-            print(traceback.format_exc())
-            result[url] = {
-                'status': 'error',
-                'error': str(e)
-            }
+    # Each URL can fan out into a full crawl - refuse oversized batches
+    if len(urls) > SCRAPE_MAX_URLS:
+        return jsonify({"error": f"Too many URLs (maximum {SCRAPE_MAX_URLS})"}), 400
+    
+    # Clients that opt in get one NDJSON line per URL as soon as it is done,
+    # instead of waiting for the whole batch to be buffered
+    if data.get('stream', False):
+        def generate():
+            for url, url_result in _scrape_results(urls, bulk_mode, use_cache):
+                yield orjson.dumps({url: url_result}, default=str, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
     
+    result = dict(_scrape_results(urls, bulk_mode, use_cache))
     return jsonify(result)
 
 # Authentication Endpoints
@@ -273,17 +869,13 @@ def register():
         if not all([name, email, password]):
             return jsonify({"message": "All fields are required"}), 400
             
-        # Check if user exists
-        existing_user = db.users.find_one({"email": email})
-        if existing_user:
-            return jsonify({"message": "Email already registered"}), 400
-            
         # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hash_password(password)
         
         # Generate OTP
-        otp = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
-        otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=15)
+        otp = f"{secrets.randbelow(1_000_000):06d}"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        otp_expiry = now + _OTP_TTL
         
         # Store user with OTP
         user = {
@@ -293,17 +885,26 @@ def register():
             'otp': otp,
             'otpExpiry': otp_expiry,
             'verified': False,
-            'createdAt': datetime.datetime.now(),
+            'createdAt': now,
             'usageCount': 0,
             'plan': 'free'
         }
         
-        db.users.insert_one(user)
+        # Without the unique index an insert would happily create a second
+        # account, so fall back to looking the email up first
+        if not email_index_ready and _otp_users.find_one({"email": email}, {"_id": 1}):
+            return jsonify({"message": "Email already registered"}), 400
+        
+        # The unique index on email rejects existing users in the same round trip
+        try:
+            _otp_users.insert_one(user)
+        except DuplicateKeyError:
+            return jsonify({"message": "Email already registered"}), 400
         
-        # Add this line here to send the email
-        send_otp_email(email, otp, name)
+        # Send the email in the background - registration doesn't wait on SMTP
+        _email_executor.submit(send_otp_email, email, otp, name)
         
-        print(f"User registered: {email} with OTP: {otp}")
+        logger.info("User registered: %s", email)
         
         # Return success with OTP (for testing)
         return jsonify({
@@ -311,7 +912,7 @@ def register():
             "otp": otp  # Remove in production
         })
     except Exception as e:
-        print(f"Registration error: {str(e)}")
+        logger.exception("Registration error")
         return jsonify({"message": "Registration failed. Please try again."}), 500
 
 @app.route('/api/auth/verify', methods=['POST'])
@@ -324,42 +925,34 @@ def verify():
         if not all([email, otp]):
             return jsonify({"message": "Email and OTP are required"}), 400
             
-        # Find user
-        user = db.users.find_one({"email": email})
-        if not user:
-            return jsonify({"message": "User not found"}), 400
-            
-        # Check OTP
-        if user.get('otp') != otp:
-            return jsonify({"message": "Invalid verification code"}), 400
-            
-        # Check expiry
-        if datetime.datetime.now() > user.get('otpExpiry'):
-            return jsonify({"message": "Verification code expired"}), 400
-            
-        # Update user status and remove OTP fields
-        db.users.update_one(
-            {"email": email},
+        # Check the code, mark the user verified and drop the OTP fields in
+        # one atomic round trip
+        updated_user = _otp_users.find_one_and_update(
+            {"email": email, "otp": otp, "otpExpiry": {"$gt": datetime.datetime.now(datetime.timezone.utc)}},
             {
                 "$set": {"verified": True},
                 "$unset": {"otp": "", "otpExpiry": ""}
-            }
+            },
+            projection=_PUBLIC_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
         
-        # Get updated user
-        updated_user = db.users.find_one({"email": email})
+        if not updated_user:
+            # Only failed attempts pay for a second lookup to explain why
+            user = db.users.find_one({"email": email}, {'otp': 1})
+            if not user:
+                return jsonify({"message": "User not found"}), 400
+            if user.get('otp') != otp:
+                return jsonify({"message": "Invalid verification code"}), 400
+            return jsonify({"message": "Verification code expired"}), 400
         
         # Create JWT token
-        token = jwt.encode({
-            'sub': str(updated_user['_id']),
-            'email': updated_user['email'],
-            'name': updated_user['name'],
-            'exp': datetime.datetime.now() + datetime.timedelta(days=30)
-        }, JWT_SECRET)
+        user_id = str(updated_user['_id'])
+        token = create_auth_token(updated_user, user_id)
         
         # Create user object without sensitive data
         user_data = {
-            'id': str(updated_user['_id']),
+            'id': user_id,
             'name': updated_user['name'],
             'email': updated_user['email'],
             'verified': updated_user['verified'],
@@ -381,7 +974,7 @@ def verify():
         
         return response
     except Exception as e:
-        print(f"Verification error: {str(e)}")
+        logger.exception("Verification error")
         return jsonify({"message": "Verification failed. Please try again."}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -395,12 +988,12 @@ def login():
             return jsonify({"message": "Email and password are required"}), 400
             
         # Find user
-        user = db.users.find_one({"email": email})
+        user = db.users.find_one({"email": email}, _LOGIN_PROJECTION)
         if not user:
             return jsonify({"message": "Invalid email or password"}), 401
             
         # Check password
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+        if not check_password(password, user['password']):
             return jsonify({"message": "Invalid email or password"}), 401
             
         # Check if verified
@@ -408,16 +1001,12 @@ def login():
             return jsonify({"message": "Please verify your email before logging in"}), 401
             
         # Create JWT token
-        token = jwt.encode({
-            'sub': str(user['_id']),
-            'email': user['email'],
-            'name': user['name'],
-            'exp': datetime.datetime.now() + datetime.timedelta(days=30)
-        }, JWT_SECRET)
+        user_id = str(user['_id'])
+        token = create_auth_token(user, user_id)
         
         # Create user object without sensitive data
         user_data = {
-            'id': str(user['_id']),
+            'id': user_id,
             'name': user['name'],
             'email': user['email'],
             'verified': user['verified'],
@@ -439,7 +1028,7 @@ def login():
         
         return response
     except Exception as e:
-        print(f"Login error: {str(e)}")
+        logger.exception("Login error")
         return jsonify({"message": "Login failed. Please try again."}), 500
 
 @app.route('/api/auth/me', methods=['GET'])
@@ -452,23 +1041,10 @@ def get_current_user():
             
         try:
             # Verify token
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            payload = decode_auth_token(token)
             
-            # Get user from database
-            user = db.users.find_one({"email": payload['email']})
-            
-            if not user:
-                return jsonify({"user": None})
-                
-            # Return user data without sensitive fields
-            user_data = {
-                'id': str(user['_id']),
-                'name': user['name'],
-                'email': user['email'],
-                'verified': user['verified'],
-                'plan': user.get('plan', 'free'),
-                'usageCount': user.get('usageCount', 0)
-            }
+            # Get user data (cached for a few seconds)
+            user_data = get_cached_user_data(payload['sub'])
             
             return jsonify({"user": user_data})
         except jwt.ExpiredSignatureError:
@@ -476,82 +1052,84 @@ def get_current_user():
         except jwt.InvalidTokenError:
             return jsonify({"user": None})
     except Exception as e:
-        print(f"Auth check error: {str(e)}")
+        logger.exception("Auth check error")
         return jsonify({"user": None})
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
+    # Drop the cached token payload and user data for this session
+    token = request.cookies.get('auth_token')
+    if token:
+        try:
+            invalidate_cached_user(decode_auth_token(token)['sub'])
+        except jwt.InvalidTokenError:
+            pass
+        with _token_cache_lock:
+            _token_cache.pop(_token_cache_key(token), None)
+    
     response = make_response(jsonify({"message": "Logged out successfully"}))
     response.delete_cookie('auth_token', path='/')
     return response
 
 @app.route('/api/usage/track', methods=['POST'])
+@require_auth
 def track_usage():
     try:
-        # Get the auth token
-        token = request.cookies.get('auth_token')
-        if not token:
-            return jsonify({"message": "Authentication required"}), 401
+        # Existence check only - a limit=1 count on _id is answered from the
+        # index without fetching the document
+        user_id = _user_object_id(g.auth.get('sub'))
+        if not user_id or not db.users.count_documents({"_id": user_id}, limit=1):
+            return jsonify({"message": "User not found"}), 404
         
-        # Verify token
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-            email = payload.get('email')
-            
-            # Get user from database
-            user = db.users.find_one({"email": email})
-            if not user:
-                return jsonify({"message": "User not found"}), 404
-            
-            # Get request data
-            data = request.json
-            urls = data.get('urls', [])
-            
-            # Update usage count
-            db.users.update_one(
-                {"email": email},
-                {"$inc": {"usageCount": 1}}
-            )
-            
-            # Optionally log detailed usage
-            usage_log = {
-                "userId": user['_id'],
-                "urls": urls,
-                "timestamp": datetime.datetime.now()
-            }
-            db.usage_logs.insert_one(usage_log)
-            
-            return jsonify({"message": "Usage tracked successfully"})
-        except jwt.ExpiredSignatureError:
-            return jsonify({"message": "Token expired"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"message": "Invalid token"}), 401
+        # Get request data
+        data = request.json
+        urls = data.get('urls', [])
+        
+        # Queue the usage event; the background writer batches it
+        _usage_queue.put({
+            "userId": user_id,
+            "urls": urls,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        })
+        
+        return jsonify({"message": "Usage tracked successfully"}), 202
     except Exception as e:
-        print(f"Error tracking usage: {str(e)}")
+        logger.exception("Error tracking usage")
         return jsonify({"message": "Failed to track usage"}), 500
 
+# Non-secret settings worth showing on the debug endpoint
+_DEBUG_ENV_KEYS = ('ENVIRONMENT', 'LOG_LEVEL', 'EMAIL_HOST', 'EMAIL_PORT', 'EMAIL_SECURE',
+                   'EMAIL_FROM', 'WEB_CONCURRENCY', 'SCRAPE_MAX_WORKERS', 'SCRAPE_MAX_URLS',
+                   'SCRAPE_MAX_REQUESTS_PER_HOST', 'SCRAPE_HOST_RATE', 'SCRAPE_HOST_BURST',
+                   'SCRAPE_MAX_RETRY_AFTER')
+
 @app.route('/api/debug', methods=['GET'])
 def debug_info():
     # Don't expose sensitive information in production
     if os.environ.get('ENVIRONMENT') == 'production':
         return jsonify({"message": "Debug endpoint disabled in production"}), 403
+    
+    # Only callers presenting DEBUG_TOKEN get in; without one configured
+    # the endpoint stays closed
+    debug_token = os.environ.get('DEBUG_TOKEN')
+    if not debug_token:
+        return jsonify({"message": "Debug endpoint disabled"}), 403
+    auth_header = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth_header, f"Bearer {debug_token}"):
+        return jsonify({"message": "Authentication required"}), 401
         
-    # Show environment variables (except secrets)
-    env_vars = {}
-    for key in os.environ:
-        if key not in ['JWT_SECRET', 'MONGODB_URI', 'EMAIL_PASSWORD']:
-            env_vars[key] = os.environ[key]
-        else:
-            env_vars[key] = "[REDACTED]"
+    # Show a fixed whitelist of settings instead of the whole environment
+    env_vars = {key: os.environ[key] for key in _DEBUG_ENV_KEYS if key in os.environ}
     
     # Basic connectivity tests
-    mongodb_status = "Working" if isinstance(db, MongoClient) else "Using in-memory fallback"
+    mongodb_status = "Working" if isinstance(db, Database) else "Using in-memory fallback"
     
     return jsonify({
         "environment": env_vars,
         "mongodb_status": mongodb_status,
-        "time": str(datetime.datetime.now())
+        "time": str(datetime.datetime.now(datetime.timezone.utc))
     })
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"})
@@ -561,4 +1139,7 @@ def test():
     return jsonify({"message": "API is working properly!"})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Local development only - production runs under gunicorn with gevent
+    # workers (see gunicorn.conf.py)
+    app.run(debug=os.environ.get('ENVIRONMENT') != 'production',
+            port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
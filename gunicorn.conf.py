@@ -0,0 +1,15 @@
+import multiprocessing
+import os
+
+# Gunicorn configuration - picked up automatically by `gunicorn app:app`
+#
+# Every endpoint is I/O bound (outbound HTTP for scraping, MongoDB, SMTP), so
+# use gevent workers: the worker monkey-patches the standard library before
+# the app is imported, letting each process multiplex many requests.
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+# Scrapes of large sites can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
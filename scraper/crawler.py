@@ -1,54 +1,138 @@
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import time
-import re
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+from urllib.parse import urljoin, urlsplit
+import functools
 import urllib3
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from scraper.throttle import CappedRetry, host_slot
+
+try:
+    import lxml.html as lxml_html
+    from lxml.etree import ParserError
+except ImportError:
+    lxml_html = None
+
+logger = logging.getLogger(__name__)
 
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Try different parsers, with fallback options
-def get_soup(html_content):
-    """Create BeautifulSoup object with fallback parsers"""
-    parsers = ['lxml', 'html.parser', 'html5lib']
+# Shared HTTP session so pages on the same site reuse keep-alive connections
+# instead of paying a TCP+TLS handshake per fetch. Transient server errors
+# are retried with a short backoff, honouring a 429/503 Retry-After up to
+# MAX_RETRY_AFTER. Read timeouts are not retried, so a dead page costs one
+# timeout rather than three, and once retries run out the last response is
+# returned rather than raised.
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=CappedRetry(total=2, read=0, backoff_factor=0.3,
+                            status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+})
+
+# lxml (libxml2) is the fastest BeautifulSoup backend; fall back to the
+# stdlib parser once at import if it is missing, rather than retrying a
+# fallback chain on every page. html5lib is never worth its cost here.
+_PARSER = 'lxml' if lxml_html is not None else 'html.parser'
+if lxml_html is None:
+    logger.warning("lxml not available. Using html.parser - crawling will be slower.")
+
+# The crawler only reads <a href> tags, so the parser can skip building
+# nodes for everything else
+_LINK_STRAINER = SoupStrainer('a', href=True)
+
+def get_soup(html_content, parse_only=None):
+    """Create BeautifulSoup object with the parser detected at import"""
+    return BeautifulSoup(html_content, _PARSER, parse_only=parse_only)
+
+def extract_hrefs(html_content, encoding=None):
+    """
+    Return the raw href of every <a> tag in an HTML document.
+    
+    Uses lxml's XPath directly when available, skipping BeautifulSoup's
+    per-node Python wrappers; falls back to BeautifulSoup otherwise.
+    
+    Args:
+        html_content (bytes): The page body
+        encoding (str): Charset from the Content-Type header, if any
+        
+    Returns:
+        list: href attribute values, in document order
+    """
+    if lxml_html is None:
+        soup = get_soup(html_content, parse_only=_LINK_STRAINER)
+        return [link['href'] for link in soup.find_all('a', href=True)]
+    
+    # lxml refuses empty documents; skip the parser for the obvious case
+    if not html_content.strip():
+        return []
     
-    for parser in parsers:
+    # Without a declared charset, lxml sniffs <meta charset> itself
+    parser = None
+    if encoding:
         try:
-            return BeautifulSoup(html_content, parser)
-        except Exception as e:
-            print(f"Parser {parser} failed: {str(e)}")
-            continue
+            parser = lxml_html.HTMLParser(encoding=encoding)
+        except LookupError:
+            parser = None
     
-    # If all parsers fail, use the most basic one with a clear warning
-    print("WARNING: All parsers failed. Using minimal parser - results may be limited.")
-    return BeautifulSoup(html_content, 'html.parser')
+    try:
+        return lxml_html.fromstring(html_content, parser=parser).xpath('//a/@href')
+    except ParserError:
+        # Nothing lxml counts as content (e.g. only a comment or an <?xml?>
+        # line) - still a fetched page, it just has no links
+        return []
+
+def _strip_params(path):
+    """
+    Drop ';params' from the last path segment, as urlparse would
+    
+    urlsplit leaves them in the path; dropping them keeps session-id
+    variants such as /shop;jsessionid=AB12 down to a single URL.
+    """
+    if ';' not in path:
+        return path
+    semicolon = path.find(';', path.rfind('/'))
+    return path if semicolon == -1 else path[:semicolon]
 
+# Pure function called for every href on every crawled page, and the same
+# links repeat across pages (navigation, footers), so memoize it. The
+# generator uses this same function, so crawled URLs and md_files keys agree.
+@functools.lru_cache(maxsize=65536)
 def normalize_url(url):
     """Normalize URL to handle various patterns and ensure no .md extensions"""
     # Skip if empty
     if not url:
         return url
-        
-    # Remove .md extension if present
-    if url.endswith('.md'):
-        url = url[:-3]
     
     # Make sure URL has a scheme
     if not url.startswith(('http://', 'https://')):
         url = 'https://' + url
     
     # Parse the URL
-    parsed = urlparse(url)
+    parsed = urlsplit(url)
     
     # Build normalized URL
-    normalized_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    normalized_url = f"{parsed.scheme}://{parsed.netloc}{_strip_params(parsed.path)}"
     
     # Remove trailing slash for consistency, unless it's the root path
     if normalized_url.endswith('/') and normalized_url != f"{parsed.scheme}://{parsed.netloc}/":
         normalized_url = normalized_url[:-1]
     
-    # Remove .md extension if it somehow got into the path
+    # Remove .md extension from the path (single check, after the trailing
+    # slash is gone so "page.md/" is caught too)
     if normalized_url.endswith('.md'):
         normalized_url = normalized_url[:-3]
     
@@ -58,124 +142,206 @@ def normalize_url(url):
     
     return normalized_url
 
-def crawl_website(base_url, max_pages=50):
+# Pages fetched at once per crawl. Overlaps the network waits; the per-host
+# limit in scraper.throttle keeps the site itself from being hammered.
+CRAWL_CONCURRENCY = 8
+
+# Largest HTML body read per crawled page
+MAX_PAGE_BYTES = 2_000_000
+
+# Links that never lead to another crawlable page. One str.startswith call
+# with a tuple rejects them before any URL parsing. In-page anchors only
+# point back at the current page, which is already queued.
+SKIPPED_HREF_PREFIXES = ('#', 'javascript:', 'mailto:', 'tel:')
+
+# File types that are never worth crawling
+SKIPPED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.pdf', '.zip', '.js', '.css',
+                      '.svg', '.ico', '.woff', '.woff2')
+
+def _clean_href(current_url, href, base_domain):
+    """
+    Resolve one href into the crawl-queue form of its URL, parsing it once.
+    
+    Args:
+        current_url (str): URL of the page the link was found on
+        href (str): Raw href attribute value
+        base_domain (str): Only links on this domain are kept
+        
+    Returns:
+        str: Cleaned same-domain URL, or None if the link should be skipped
+    """
+    # Join relative URLs and parse the result a single time
+    parsed_url = urlsplit(urljoin(current_url, href))
+    
+    # Filter URLs:
+    # 1. Same domain
+    # 2. HTTP/HTTPS scheme
+    if parsed_url.netloc != base_domain or parsed_url.scheme not in ('http', 'https'):
+        return None
+    
+    # Same path cleanup normalize_url does: drop a non-root trailing slash,
+    # then any .md extension
+    path = _strip_params(parsed_url.path)
+    if path.endswith('/') and path != '/':
+        path = path[:-1]
+    if path.endswith('.md'):
+        path = path[:-3]
+    
+    # Clean the URL (remove fragments and query params for deduplication)
+    clean_url = f"{parsed_url.scheme}://{parsed_url.netloc}{path}"
+    
+    # Add trailing slash if needed for consistency (rpartition looks at the
+    # last segment without splitting the whole URL into a list)
+    if not clean_url.endswith('/') and '.' not in clean_url.rpartition('/')[2]:
+        clean_url += '/'
+    
+    # Remove common file extensions we don't want
+    if clean_url.endswith(SKIPPED_EXTENSIONS):
+        return None
+    
+    # Remove .md extension if present
+    if clean_url.endswith('.md'):
+        clean_url = clean_url[:-3]
+    
+    return clean_url
+
+def fetch_page_links(current_url, base_domain):
+    """
+    Fetch one page and extract the same-domain links on it.
+    
+    Args:
+        current_url (str): The URL to fetch
+        base_domain (str): Only links on this domain are returned
+        
+    Returns:
+        list: Cleaned same-domain URLs linked from the page, or None if the
+              page could not be fetched or is not HTML
+    """
+    try:
+        logger.debug("Crawling: %s", current_url)
+        
+        # Disable SSL verification to avoid certificate issues. Stream the
+        # body so oversized pages are never downloaded in full. The host
+        # slot is held until the body has been read.
+        with host_slot(current_url), \
+                _session.get(current_url, timeout=15, verify=False, stream=True) as response:
+            # Process only if status code is OK
+            if response.status_code != 200:
+                logger.info("Failed to fetch %s, status code: %s", current_url, response.status_code)
+                return None
+            
+            # Only process HTML content
+            content_type = response.headers.get('Content-Type', '').lower()
+            if 'text/html' not in content_type:
+                logger.debug("Skipping non-HTML content: %s", current_url)
+                return None
+            
+            # Skip pages that announce themselves as too big up front
+            content_length = response.headers.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) > MAX_PAGE_BYTES:
+                logger.info("Skipping oversized page: %s (%s bytes)", current_url, content_length)
+                return None
+            
+            # Declared charset only - requests would otherwise assume latin-1
+            charset = None
+            if 'charset=' in content_type:
+                charset = requests.utils.get_encoding_from_headers(response.headers)
+            
+            # Read at most MAX_PAGE_BYTES; links past that point are dropped
+            body = response.raw.read(MAX_PAGE_BYTES, decode_content=True)
+        
+        # Pull only the links out of the HTML content
+        links = []
+        for href in extract_hrefs(body, charset):
+            # Skip empty, javascript, mail/phone and in-page anchor links
+            if not href or href.startswith(SKIPPED_HREF_PREFIXES):
+                continue
+            
+            clean_url = _clean_href(current_url, href, base_domain)
+            if clean_url:
+                links.append(clean_url)
+        
+        return links
+    
+    except Exception as e:
+        logger.warning("Error crawling %s: %s", current_url, e)
+        return None
+
+# Recent crawl results per (base URL, page limit). Site structure rarely
+# changes within the hour, and re-running a crawl is by far the slowest step.
+CRAWL_CACHE_TTL = 3600  # seconds
+_crawl_cache = TTLCache(maxsize=1024, ttl=CRAWL_CACHE_TTL)
+_crawl_cache_lock = threading.Lock()
+
+def crawl_website(base_url, max_pages=50, use_cache=True):
     """
     Crawl a website and extract all URLs within the same domain.
     
+    Pages are fetched breadth-first, up to CRAWL_CONCURRENCY at a time.
+    
     Args:
         base_url (str): The starting URL to crawl
         max_pages (int): Maximum number of pages to crawl
+        use_cache (bool): Whether a recent crawl of the same site may be reused
         
     Returns:
         list: List of discovered URLs
     """
-    print(f"Starting to crawl: {base_url}")
-    
     # Normalize the base URL
     base_url = normalize_url(base_url)
     
+    cache_key = (base_url, max_pages)
+    if use_cache:
+        with _crawl_cache_lock:
+            cached = _crawl_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Using cached crawl for: %s", base_url)
+            return list(cached)
+    
+    logger.debug("Starting to crawl: %s", base_url)
+    
     # Parse the base URL to get the domain
-    parsed_base = urlparse(base_url)
+    parsed_base = urlsplit(base_url)
     base_domain = parsed_base.netloc
     
-    # Initialize sets for tracking
-    visited_urls = set()
-    urls_to_visit = {base_url}
+    # FIFO queue for breadth-first order, plus every URL ever queued so
+    # nothing is fetched twice
+    urls_to_visit = deque([base_url])
+    enqueued = {base_url}
     discovered_urls = set()
     
-    # Continue until no more URLs to visit or max limit reached
-    while urls_to_visit and len(visited_urls) < max_pages:
-        # Get the next URL to visit
-        current_url = urls_to_visit.pop()
-        
-        # Skip if already visited
-        if current_url in visited_urls:
-            continue
-        
-        try:
-            print(f"Crawling: {current_url}")
-            
-            # Add a small delay to be respectful
-            time.sleep(0.3)
+    with ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY) as executor:
+        # Continue until no more URLs to visit or max limit reached
+        while urls_to_visit and len(discovered_urls) < max_pages:
+            # Fetch the next wave, never more than the pages still allowed
+            batch_size = min(len(urls_to_visit), max_pages - len(discovered_urls))
+            batch = [urls_to_visit.popleft() for _ in range(batch_size)]
             
-            # Send request with appropriate headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-            }
-            
-            # Disable SSL verification to avoid certificate issues
-            response = requests.get(current_url, headers=headers, timeout=15, verify=False)
-            
-            # Process only if status code is OK
-            if response.status_code == 200:
-                content_type = response.headers.get('Content-Type', '').lower()
+            results = executor.map(lambda url: fetch_page_links(url, base_domain), batch)
+            for current_url, links in zip(batch, results):
+                if links is None:
+                    continue
                 
-                # Only process HTML content
-                if 'text/html' in content_type:
-                    visited_urls.add(current_url)
-                    discovered_urls.add(current_url)
-                    
-                    # Parse the HTML content with fallback parsers
-                    soup = get_soup(response.text)
-                    
-                    # Extract all links
-                    for link in soup.find_all('a', href=True):
-                        href = link['href']
-                        
-                        # Skip empty, javascript, and anchor links
-                        if not href or href.startswith('javascript:') or href == '#':
-                            continue
-                            
-                        # Join relative URLs
-                        full_url = urljoin(current_url, href)
-                        
-                        # Normalize the URL to remove .md extensions
-                        full_url = normalize_url(full_url)
-                        
-                        parsed_url = urlparse(full_url)
-                        
-                        # Filter URLs:
-                        # 1. Same domain
-                        # 2. HTTP/HTTPS scheme
-                        if (parsed_url.netloc == base_domain and
-                            parsed_url.scheme in ('http', 'https')):
-                            
-                            # Clean the URL (remove fragments and query params for deduplication)
-                            clean_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-                            
-                            # Add trailing slash if needed for consistency
-                            if not clean_url.endswith('/') and '.' not in clean_url.split('/')[-1]:
-                                clean_url += '/'
-                            
-                            # Remove common file extensions we don't want
-                            if not any(clean_url.endswith(ext) for ext in 
-                                      ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.zip', '.js', '.css']):
-                                
-                                # Remove .md extension if present
-                                if clean_url.endswith('.md'):
-                                    clean_url = clean_url[:-3]
-                                
-                                # Add to the queue if not visited
-                                if clean_url not in visited_urls and clean_url not in urls_to_visit:
-                                    urls_to_visit.add(clean_url)
-                else:
-                    print(f"Skipping non-HTML content: {current_url}")
-            else:
-                print(f"Failed to fetch {current_url}, status code: {response.status_code}")
+                discovered_urls.add(current_url)
                 
-        except Exception as e:
-            print(f"Error crawling {current_url}: {str(e)}")
-            continue
+                # Add to the queue if not queued before
+                for clean_url in links:
+                    if clean_url not in enqueued:
+                        enqueued.add(clean_url)
+                        urls_to_visit.append(clean_url)
     
-    print(f"Crawling complete. Discovered {len(discovered_urls)} URLs.")
+    logger.info("Crawling complete. Discovered %d URLs for %s", len(discovered_urls), base_url)
     
     # If no URLs were discovered, at least include the base URL
     if not discovered_urls:
         discovered_urls.add(base_url)
     
-    # Final cleanup: ensure all URLs are normalized and don't have .md extensions
-    clean_discovered_urls = [normalize_url(url) for url in discovered_urls]
+    # Final cleanup: ensure all URLs are normalized and don't have .md
+    # extensions. Two crawled forms can normalize to the same URL, and each
+    # entry costs a page fetch later on, so drop the repeats.
+    clean_discovered_urls = list(dict.fromkeys(normalize_url(url) for url in discovered_urls))
+    
+    with _crawl_cache_lock:
+        _crawl_cache[cache_key] = tuple(clean_discovered_urls)
         
-    return clean_discovered_urls
\ No newline at end of file
+    return clean_discovered_urls
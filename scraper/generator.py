@@ -1,58 +1,135 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urlparse, urljoin
-import time
 import re
-import datetime
 import urllib3
 import html
-import traceback
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from scraper.crawler import normalize_url
+from scraper.throttle import CappedRetry, host_slot
+
+logger = logging.getLogger(__name__)
 
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Try different parsers, with fallback options
-def get_soup(html_content):
-    """Create BeautifulSoup object with fallback parsers"""
-    parsers = ['html.parser', 'lxml', 'html5lib']
+# Shared HTTP session: the homepage fetch and every markdown page fetch hit
+# the same site, so keep-alive connections are reused instead of paying a
+# TCP+TLS handshake per page. Transient server errors are retried briefly
+# (Retry-After is honoured up to MAX_RETRY_AFTER; read timeouts are not
+# retried).
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=CappedRetry(total=2, read=0, backoff_factor=0.3,
+                            status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+})
+
+# Largest HTML body read per page; anything past it is dropped so one huge
+# or misbehaving page cannot balloon a worker's memory
+MAX_PAGE_BYTES = 2_000_000
+
+def fetch_page(url, headers=None):
+    """
+    Fetch a page over the shared session, reading at most MAX_PAGE_BYTES
     
-    for parser in parsers:
-        try:
-            return BeautifulSoup(html_content, parser)
-        except Exception as e:
-            print(f"Parser {parser} failed: {str(e)}")
-            continue
+    Args:
+        url (str): The page to fetch
+        headers (dict): Optional extra request headers (conditional GETs)
+        
+    Returns:
+        tuple: (status code, body, validators) - body is str when the
+               response declares a charset, raw bytes otherwise (BeautifulSoup
+               sniffs those), and None when the status is not 200; validators
+               are the conditional headers to send on the next fetch
+    """
+    # Stream so the body is never downloaded past the cap. The per-host slot
+    # is shared with the crawler and held until the body has been read.
+    with host_slot(url), \
+            _session.get(url, timeout=15, verify=False, stream=True, headers=headers) as response:
+        if response.status_code != 200:
+            return response.status_code, None, {}
+        
+        # Remember the validators so a later fetch can ask for 304
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        
+        # Declared charset only - requests would otherwise assume latin-1
+        # or run its slow charset detection over the whole body
+        encoding = None
+        if 'charset=' in response.headers.get('Content-Type', '').lower():
+            encoding = requests.utils.get_encoding_from_headers(response.headers)
+        
+        body = response.raw.read(MAX_PAGE_BYTES, decode_content=True)
     
-    # If all parsers fail, use the most basic approach
-    print("WARNING: All parsers failed. Using minimal approach.")
-    return BeautifulSoup(html_content, 'html.parser')
+    if encoding:
+        try:
+            return 200, body.decode(encoding, errors='replace'), validators
+        except LookupError:
+            pass
+    return 200, body, validators
+
+# lxml (libxml2) builds trees several times faster than the pure-Python
+# html.parser. Pick the parser once at import instead of retrying a
+# fallback chain on every call.
+try:
+    import lxml  # noqa: F401
+    _PARSER = 'lxml'
+except ImportError:
+    _PARSER = 'html.parser'
+    logger.warning("lxml not available. Using html.parser - page conversion will be slower.")
+
+def get_soup(html_content, parse_only=None):
+    """Create BeautifulSoup object with the parser detected at import"""
+    return BeautifulSoup(html_content, _PARSER, parse_only=parse_only)
+
+# clean_text runs on every text node of every converted page, so its
+# patterns are compiled once here instead of looked up on each call
+_TAG_RE = re.compile(r'<[^>]+>')
+# HTML tags plus stray data-*/id/class attributes, removed in a single pass
+_ARTIFACT_RE = re.compile(r'<[^>]+>|data-[a-zA-Z0-9_\-]+="[^"]+"|id="[^"]+"|class="[^"]+"')
+_TITLE_SUFFIX_RE = re.compile(r'\s+[-|]\s+.*$')
+_EXCESS_NEWLINES_RE = re.compile(r'\n{3,}')
 
 def clean_text(text):
     """Clean up text by removing extra whitespace, HTML, and other artifacts"""
     if not text:
         return ""
     
-    # Decode HTML entities
-    text = html.unescape(text)
-    
-    # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Remove data attributes and other artifacts
-    text = re.sub(r'data-[a-zA-Z0-9_\-]+="[^"]+"', '', text)
-    text = re.sub(r'id="[^"]+"', '', text)
-    text = re.sub(r'class="[^"]+"', '', text)
-    
-    # Replace multiple whitespace with single space
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove leading/trailing whitespace
-    return text.strip()
+    # Most text (link labels, list items) has no entities or markup, so
+    # only the whitespace needs collapsing
+    if '&' in text or '<' in text or '="' in text:
+        # Decode HTML entities
+        text = html.unescape(text)
+        
+        # Remove HTML tags, data attributes and other artifacts in one sweep
+        # (none of them can match without a '<' or a '="')
+        if '<' in text or '="' in text:
+            text = _ARTIFACT_RE.sub('', text)
+    
+    # Replace multiple whitespace with single space and trim the ends.
+    # str.split() splits on exactly the characters the old \s+ regex
+    # matched, without going through the regex engine.
+    return ' '.join(text.split())
 
 def normalize_title(title):
     """Normalize title to make it more readable"""
     # Remove common suffixes like " - Website Name"
-    title = re.sub(r'\s+[-|]\s+.*$', '', title)
+    title = _TITLE_SUFFIX_RE.sub('', title)
     title = clean_text(title)
     
     # Capitalize first letter of each word for consistency
@@ -61,49 +138,58 @@ def normalize_title(title):
     
     return title
 
-def normalize_url(url):
-    """Normalize URL to handle various patterns and ensure no .md extensions"""
-    # Skip if empty
-    if not url:
-        return url
-        
-    # Remove .md extension if present
-    if url.endswith('.md'):
-        url = url[:-3]
-    
-    # Make sure URL has a scheme
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url
-    
-    # Parse the URL
-    parsed = urlparse(url)
-    
-    # Build normalized URL
-    normalized_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-    
-    # Remove trailing slash for consistency, unless it's the root path
-    if normalized_url.endswith('/') and normalized_url != f"{parsed.scheme}://{parsed.netloc}/":
-        normalized_url = normalized_url[:-1]
-    
-    # Remove .md extension if it somehow got into the path
-    if normalized_url.endswith('.md'):
-        normalized_url = normalized_url[:-3]
-    
-    # Keep query parameters if they exist
-    if parsed.query:
-        normalized_url += f"?{parsed.query}"
+# Tags extract_site_info reads: title/h1, meta descriptions, the first
+# paragraph, and links (including those inside navigation containers)
+_SITE_INFO_TAGS = frozenset(['title', 'meta', 'h1', 'p', 'a', 'nav', 'header'])
+_NAV_CLASSES = frozenset(['nav', 'menu', 'navigation', 'navbar'])
+
+def _is_site_info_tag(name, attrs):
+    """SoupStrainer filter keeping only the elements extract_site_info uses"""
+    if name in _SITE_INFO_TAGS:
+        return True
+    classes = attrs.get('class') or ''
+    if isinstance(classes, str):
+        classes = classes.split()
+    return not _NAV_CLASSES.isdisjoint(classes)
+
+_SITE_INFO_STRAINER = SoupStrainer(_is_site_info_tag)
+
+# In-page anchors and script links never make important links. Checked
+# with one str.startswith call, as in the crawler.
+SKIPPED_HREF_PREFIXES = ('#', 'javascript:')
+
+def _is_same_host(href, base_domain, base_prefixes):
+    """
+    Check whether an absolute link points at the site's own host
     
-    return normalized_url
+    Args:
+        href (str): Absolute URL of the link
+        base_domain (str): Host of the site being described
+        base_prefixes (tuple): "https://host/" and "http://host/"
+        
+    Returns:
+        bool: True if the link's host is base_domain
+    """
+    # Almost every internal link starts with one of the prefixes, which
+    # settles it without building a ParseResult
+    if href.startswith(base_prefixes):
+        return True
+    return urlparse(href).netloc == base_domain
 
 def extract_site_info(url, html_content):
     """Extract site information for LLMs.txt"""
     # Normalize the URL
     url = normalize_url(url)
     
-    soup = get_soup(html_content)
+    # Skip building the tree for everything the lookups below never touch
+    soup = get_soup(html_content, parse_only=_SITE_INFO_STRAINER)
+    
+    # The site's host, parsed once for the link filters below
+    base_domain = urlparse(url).netloc
+    base_prefixes = (f"https://{base_domain}/", f"http://{base_domain}/")
     
     # Extract title
-    title = urlparse(url).netloc  # Default to domain name
+    title = base_domain  # Default to domain name
     if soup.title:
         title = normalize_title(soup.title.string)
     else:
@@ -131,49 +217,75 @@ def extract_site_info(url, html_content):
     
     # Find important links
     important_links = []
-    processed_urls = set()  # Track processed URLs to avoid duplicates
+    processed_urls = set()  # Normalized URLs already kept, shared by both passes
     
     # Look for navigation menus first
     nav_elements = soup.select('nav, .nav, .menu, .navigation, .navbar, header')
     for nav in nav_elements:
+        # Same 10-link limit as the fallback pass below, so menu-heavy sites
+        # stop after the first usable links instead of cleaning and resolving
+        # every anchor in every menu
+        if len(important_links) >= 10:
+            break
+        
         for link in nav.find_all('a', href=True):
             href = link['href']
+            
+            # Prefix test first, so skipped links are never walked for text
+            if not href or href.startswith(SKIPPED_HREF_PREFIXES):
+                continue
+            
             text = clean_text(link.get_text())
+            if not text:
+                continue
             
-            if text and href and not href.startswith('#') and not href.startswith('javascript:'):
-                # Make absolute URL if relative
-                if not href.startswith(('http://', 'https://')):
-                    href = urljoin(url, href)
-                
-                # Skip if already processed or external
-                parsed_href = urlparse(href)
-                if href in processed_urls or parsed_href.netloc != urlparse(url).netloc:
-                    continue
-                
-                processed_urls.add(href)
-                important_links.append((text, href))
+            # Make absolute URL if relative
+            if not href.startswith(('http://', 'https://')):
+                href = urljoin(url, href)
+            
+            # Skip if already processed or external. Deduplicate on the
+            # normalized form so "/a", "/a/" and "/a#top" count once.
+            seen_key = normalize_url(href)
+            if seen_key in processed_urls or not _is_same_host(href, base_domain, base_prefixes):
+                continue
+            
+            processed_urls.add(seen_key)
+            important_links.append((text, href))
+            
+            if len(important_links) >= 10:  # Limit to 10 important links
+                break
     
     # If not enough nav links, get other prominent links
     if len(important_links) < 5:
         for a in soup.find_all('a', href=True):
             href = a['href']
+            
+            # Prefix test first, so skipped links are never walked for text
+            if not href or href.startswith(SKIPPED_HREF_PREFIXES):
+                continue
+            
             text = clean_text(a.get_text())
+            if not text:
+                continue
             
-            if text and href and not href.startswith('#') and not href.startswith('javascript:'):
-                # Make absolute URL if relative
-                if not href.startswith(('http://', 'https://')):
-                    href = urljoin(url, href)
-                
-                # Skip if already processed or external
-                parsed_href = urlparse(href)
-                if href in processed_urls or parsed_href.netloc != urlparse(url).netloc:
-                    continue
-                
-                processed_urls.add(href)
-                important_links.append((text, href))
-                
-                if len(important_links) >= 10:  # Limit to 10 important links
-                    break
+            # Make absolute URL if relative
+            if not href.startswith(('http://', 'https://')):
+                href = urljoin(url, href)
+            
+            # Skip if already processed or external. Deduplicate on the
+            # normalized form so "/a", "/a/" and "/a#top" count once.
+            seen_key = normalize_url(href)
+            if seen_key in processed_urls or not _is_same_host(href, base_domain, base_prefixes):
+                continue
+            
+            processed_urls.add(seen_key)
+            important_links.append((text, href))
+            
+            if len(important_links) >= 10:  # Limit to 10 important links
+                break
+    
+    # Everything kept above is plain strings, so the tree can go now
+    soup.decompose()
     
     return {
         'title': title,
@@ -182,49 +294,107 @@ def extract_site_info(url, html_content):
     }
 
 def remove_md_extensions(content):
-    """Remove .md extensions from all URLs in markdown content"""
-    # This pattern matches markdown links [text](url.md) and captures the components
-    pattern = r'\[(.*?)\]\((.*?)\.md([^\)]*)\)'
+    """
+    Remove .md extensions from all URLs in markdown content
+    
+    Rewrites every link [text](url.md...) on a single line as
+    [text](url...), adding https:// when the URL has no scheme. Link text
+    can't contain ']' and the URL ends at the first ')'.
     
-    def replace_link(match):
-        text = match.group(1)
-        url = match.group(2)
-        extra = match.group(3) if match.group(3) else ""
+    Args:
+        content (str): Markdown that may link to .md URLs
+        
+    Returns:
+        str: The content with those links rewritten
+    """
+    # Nothing to clean - links are already normalized when generated
+    if '.md' not in content:
+        return content
+    
+    # A single left-to-right scan over each '](' instead of a regex: on one
+    # long line (clean_text folds whole blocks onto one) backtracking over
+    # every '[' or '](' went quadratic. The next ')', newline and '.md' are
+    # each looked up once and reused until the scan moves past them, so
+    # every character is visited a bounded number of times.
+    parts = []
+    done = 0  # content[:done] is already in parts
+    search = 0
+    close = newline = md = -1
+    while True:
+        mid = content.find('](', search)
+        if mid == -1:
+            break
+        url_start = mid + 2
+        search = mid + 1
+        
+        if close < url_start:
+            close = content.find(')', url_start)
+            if close == -1:
+                break
+        if md < url_start:
+            md = content.find('.md', url_start)
+            if md == -1:
+                break
+        if newline < url_start:
+            newline = content.find('\n', url_start)
+            if newline == -1:
+                newline = len(content)
+        
+        # The URL has to reach '.md' before it closes, all on this line
+        if md + 3 > close or newline < close:
+            continue
         
+        # The link text runs back to the earliest '[' with no ']' or line
+        # break between it and the '](', and can't reach into the last match
+        start = content.rfind(']', done, mid) + 1 or done
+        start = content.rfind('\n', start, mid) + 1 or start
+        open_bracket = content.find('[', start, mid)
+        if open_bracket == -1:
+            continue
+        
+        url = content[url_start:md]
         # Ensure URL has https:// if it's not already starting with http
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
-            
-        return f'[{text}]({url}{extra})'
-    
-    # Replace all markdown links with cleaned versions
-    cleaned_content = re.sub(pattern, replace_link, content)
-    return cleaned_content
+        
+        parts.append(content[done:open_bracket])
+        parts.append(f'[{content[open_bracket + 1:mid]}]({url}{content[md + 3:close]})')
+        done = search = close + 1
+    
+    if not parts:
+        return content
+    parts.append(content[done:])
+    return ''.join(parts)
 
-def generate_llms_txt(url):
+def generate_llms_txt(url, pages=None):
     """
     Generate content for LLMs.txt file with comprehensive markdown conversion
     
     Args:
         url (str): The URL to extract information from
+        pages (dict): Optional; a successful homepage fetch is stored here
+                      (normalized URL -> fetch_page result) so
+                      generate_md_files can reuse it instead of downloading
+                      the page again
         
     Returns:
         str: Content for LLMs.txt file
     """
     try:
-        # Normalize the URL
+        # Normalize the URL, and take its host once for every section below
         url = normalize_url(url)
+        domain = urlparse(url).netloc
         
-        # Send request with appropriate headers
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        }
-        response = requests.get(url, headers=headers, timeout=15, verify=False)
+        # Fetch over the shared keep-alive session
+        status_code, page_html, validators = fetch_page(url)
+        # Only a 200 is shared: a transient error (e.g. a 503 still failing
+        # after the retries) is left for generate_md_files to fetch afresh
+        if pages is not None and status_code == 200:
+            pages[url] = (status_code, page_html, validators)
         
-        if response.status_code != 200:
-            domain = urlparse(url).netloc
+        if status_code != 200:
             error_output = f"""# {domain}
-> This website could not be accessed (Status code: {response.status_code})
+> This website could not be accessed (Status code: {status_code})
 
 ## Main Website
 - [Homepage](https://{domain}): Website homepage
@@ -232,58 +402,41 @@ def generate_llms_txt(url):
             # Apply cleaning to ensure no .md extensions
             return remove_md_extensions(error_output)
         
-        # Parse the HTML
-        soup = get_soup(response.text)
-        
         # Extract site information
-        site_info = extract_site_info(url, response.text)
+        site_info = extract_site_info(url, page_html)
         
-        # Build the LLMs.txt file according to the spec
-        llms_txt = f"# {site_info['title']}\n"
+        # Build the LLMs.txt file according to the spec, collecting the
+        # pieces in a list and joining them once at the end
+        parts = [f"# {site_info['title']}\n"]
         
         # Add description as blockquote
         if site_info['description']:
-            llms_txt += f"> {site_info['description']}\n\n"
+            parts.append(f"> {site_info['description']}\n\n")
         else:
-            domain = urlparse(url).netloc
-            llms_txt += f"> Website at {domain}\n\n"
+            parts.append(f"> Website at {domain}\n\n")
         
         # Add general information paragraph
-        domain = urlparse(url).netloc
-        llms_txt += f"This file provides information about content available on {domain}. "
+        parts.append(f"This file provides information about content available on {domain}. ")
      
         
         # Add file lists with H2 headers
         if site_info['important_links']:
             # Group links by domain/path to create meaningful sections
-            sections = {}
-            processed_urls = set()  # For deduplication
+            # (extract_site_info has already deduplicated them). Sections keep
+            # the order their first link appeared in.
+            sections = defaultdict(list)
             
             for link_text, link_url in site_info['important_links']:
                 parsed_url = urlparse(link_url)
                 
                 # Skip external links
-                if parsed_url.netloc != urlparse(url).netloc:
+                if parsed_url.netloc != domain:
                     continue
                 
-                # Skip if already processed (deduplication)
-                if link_url in processed_urls:
-                    continue
-                
-                processed_urls.add(link_url)
-                
-                # Determine section based on first path segment
-                if not parsed_url.path or parsed_url.path == '/':
-                    section = 'Main Pages'
-                else:
-                    path_segments = [s for s in parsed_url.path.split('/') if s]
-                    if path_segments:
-                        section = path_segments[0].capitalize()
-                    else:
-                        section = 'Main Pages'
-                
-                if section not in sections:
-                    sections[section] = []
+                # Determine section based on first non-empty path segment
+                # (string ops only, no per-link list of segments)
+                first_segment = parsed_url.path.strip('/').partition('/')[0]
+                section = first_segment.capitalize() if first_segment else 'Main Pages'
                 
                 # Make sure the URL is normalized and has https:// but no .md
                 clean_url = normalize_url(link_url)
@@ -294,36 +447,33 @@ def generate_llms_txt(url):
                     if parsed_url.path == '/' or not parsed_url.path:
                         link_text = 'Homepage'
                     else:
-                        link_text = parsed_url.path.split('/')[-1].replace('-', ' ').replace('_', ' ').capitalize()
+                        link_text = parsed_url.path.rpartition('/')[2].replace('-', ' ').replace('_', ' ').capitalize()
                 
                 sections[section].append((link_text, clean_url))
             
             # If we don't have good sections, use default ones
             if not sections:
-                domain = urlparse(url).netloc
                 sections['Main Pages'] = [('Homepage', f"https://{domain}")]
             
             # Add each section to the LLMs.txt
             for section, links in sections.items():
-                llms_txt += f"## {section}\n"
+                parts.append(f"## {section}\n")
                 for link_text, clean_url in links:
-                    llms_txt += f"- [{link_text}]({clean_url})\n"
-                llms_txt += "\n"
+                    parts.append(f"- [{link_text}]({clean_url})\n")
+                parts.append("\n")
             
         else:
             # If no links found, just include the homepage
-            domain = urlparse(url).netloc
-            llms_txt += "## Main Website\n"
-            llms_txt += f"- [Homepage](https://{domain}): Website homepage\n\n"
+            parts.append("## Main Website\n")
+            parts.append(f"- [Homepage](https://{domain}): Website homepage\n\n")
         
         # One final check to ensure no .md extensions remain
-        llms_txt = remove_md_extensions(llms_txt)
+        llms_txt = remove_md_extensions(''.join(parts))
         
         return llms_txt
         
     except Exception as e:
-        print(f"Error generating LLMs.txt: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error generating LLMs.txt for %s", url)
         # Return a basic file if there's an error
         domain = urlparse(url).netloc
         basic_output = f"""# {domain}
@@ -335,158 +485,200 @@ def generate_llms_txt(url):
         # Apply cleaning to ensure no .md extensions
         return remove_md_extensions(basic_output)
 
+def _child_tags(element, name):
+    """Direct children of element that are <name> tags, in document order"""
+    # Plain iteration over .children; find_all(recursive=False) would run
+    # bs4's generic filter machinery for every child
+    return [child for child in element.children if child.name == name]
+
 def html_to_markdown(element, base_url='', level=0):
     """Convert HTML element to markdown recursively"""
+    # Every piece is appended to one list and joined once at the end, rather
+    # than each level concatenating and re-copying its children's strings
+    out = []
+    _html_to_markdown(element, base_url, level, out)
+    return ''.join(out)
+
+# Tags whose content never appears in the markdown
+_SKIPPED_MARKDOWN_TAGS = frozenset(['script', 'style', 'meta', 'link', 'iframe', 'noscript'])
+
+def _html_to_markdown(element, base_url, level, out):
+    """Append the markdown for an HTML element to out, recursing into children"""
     if element is None:
-        return ""
+        return
     
-    # If the element is a string, return it cleaned
+    # If the element is a string, emit it cleaned
     if isinstance(element, str):
-        return clean_text(element)
+        out.append(clean_text(element))
+        return
     
     # Skip script, style, and hidden elements
     tag_name = element.name if hasattr(element, 'name') else None
-    if not tag_name or tag_name in ['script', 'style', 'meta', 'link', 'iframe', 'noscript']:
-        return ""
+    if not tag_name or tag_name in _SKIPPED_MARKDOWN_TAGS:
+        return
     
     # Check if element is hidden
     style = element.get('style', '')
     if 'display:none' in style or 'visibility:hidden' in style:
-        return ""
+        return
     
-    result = ""
+    # One dict lookup picks the handler; divs, sections and every other
+    # element without one just have their children processed
+    handler = _MARKDOWN_HANDLERS.get(tag_name, _emit_children)
+    handler(element, base_url, level, out)
+
+def _emit_children(element, base_url, level, out):
+    """Process all children of a container or unhandled element"""
+    for child in element.children:
+        _html_to_markdown(child, base_url, level, out)
+
+def _emit_heading(element, base_url, level, out):
+    """Handle heading tags"""
+    level_num = int(element.name[1])
+    text = clean_text(element.get_text())
+    if text:
+        out.append('#' * level_num + ' ' + text + '\n\n')
+
+def _emit_paragraph(element, base_url, level, out):
+    """Handle paragraph"""
+    text = clean_text(element.get_text())
+    if text:
+        out.append(text + '\n\n')
+
+def _emit_link(element, base_url, level, out):
+    """Handle links"""
+    href = element.get('href')
+    if not href or href.startswith('javascript:'):
+        # Not a usable link - process children like any other element,
+        # without first walking them for link text that won't be used
+        _emit_children(element, base_url, level, out)
+        return
+    
+    text = clean_text(element.get_text())
+    
+    if text:
+        # Make absolute URL if relative, ensure no .md
+        if not href.startswith(('http://', 'https://')):
+            href = urljoin(base_url, href)
+        
+        # Normalize URL to remove .md if present
+        href = normalize_url(href)
+        
+        out.append(f"[{text}]({href})")
+    else:
+        # Process children normally if not a valid link
+        _emit_children(element, base_url, level, out)
+
+def _emit_image(element, base_url, level, out):
+    """Handle images"""
+    src = element.get('src')
+    if not src:
+        _emit_children(element, base_url, level, out)
+        return
     
-    # Handle heading tags
-    if tag_name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-        level_num = int(tag_name[1])
-        text = clean_text(element.get_text())
-        if text:
-            result += '#' * level_num + ' ' + text + '\n\n'
+    alt = element.get('alt', '')
     
-    # Handle paragraph
-    elif tag_name == 'p':
-        text = clean_text(element.get_text())
-        if text:
-            result += text + '\n\n'
+    # Make absolute URL if relative
+    if not src.startswith(('http://', 'https://')):
+        src = urljoin(base_url, src)
     
-    # Handle links
-    elif tag_name == 'a' and element.get('href'):
-        href = element.get('href')
-        text = clean_text(element.get_text())
+    out.append(f"![{alt}]({src})\n\n")
+
+def _emit_unordered_list(element, base_url, level, out):
+    """Handle unordered lists"""
+    for li in _child_tags(element, 'li'):
+        li_text = clean_text(li.get_text())
+        if li_text:
+            out.append('- ' + li_text + '\n')
+    out.append('\n')
+
+def _emit_ordered_list(element, base_url, level, out):
+    """Handle ordered lists"""
+    for i, li in enumerate(_child_tags(element, 'li')):
+        li_text = clean_text(li.get_text())
+        if li_text:
+            out.append(f"{i+1}. " + li_text + '\n')
+    out.append('\n')
+
+def _emit_blockquote(element, base_url, level, out):
+    """Handle blockquotes"""
+    text = clean_text(element.get_text())
+    if text:
+        lines = text.split('\n')
+        for line in lines:
+            if line.strip():
+                out.append('> ' + line + '\n')
+        out.append('\n')
+
+def _emit_code(element, base_url, level, out):
+    """Handle code"""
+    text = clean_text(element.get_text())
+    if text:
+        out.append(f"`{text}`")
+
+def _emit_pre(element, base_url, level, out):
+    """Handle pre (code blocks)"""
+    text = clean_text(element.get_text())
+    if text:
+        out.append(f"```\n{text}\n```\n\n")
+
+def _emit_table(element, base_url, level, out):
+    """Handle tables"""
+    rows = element.find_all('tr')
+    if rows:
+        # Extract headers
+        headers = []
+        header_row = None
         
-        if text and href and not href.startswith('javascript:'):
-            # Make absolute URL if relative, ensure no .md
-            if not href.startswith(('http://', 'https://')):
-                href = urljoin(base_url, href)
-            
-            # Normalize URL to remove .md if present
-            href = normalize_url(href)
-            
-            result += f"[{text}]({href})"
-        else:
-            # Process children normally if not a valid link
-            for child in element.children:
-                result += html_to_markdown(child, base_url, level)
-    
-    # Handle images
-    elif tag_name == 'img' and element.get('src'):
-        src = element.get('src')
-        alt = element.get('alt', '')
-        
-        # Make absolute URL if relative
-        if not src.startswith(('http://', 'https://')):
-            src = urljoin(base_url, src)
-        
-        result += f"![{alt}]({src})\n\n"
-    
-    # Handle lists
-    elif tag_name == 'ul':
-        for li in element.find_all('li', recursive=False):
-            li_text = clean_text(li.get_text())
-            if li_text:
-                result += '- ' + li_text + '\n'
-        result += '\n'
-    
-    elif tag_name == 'ol':
-        for i, li in enumerate(element.find_all('li', recursive=False)):
-            li_text = clean_text(li.get_text())
-            if li_text:
-                result += f"{i+1}. " + li_text + '\n'
-        result += '\n'
-    
-    # Handle blockquotes
-    elif tag_name == 'blockquote':
-        text = clean_text(element.get_text())
-        if text:
-            lines = text.split('\n')
-            for line in lines:
-                if line.strip():
-                    result += '> ' + line + '\n'
-            result += '\n'
-    
-    # Handle code
-    elif tag_name == 'code':
-        text = clean_text(element.get_text())
-        if text:
-            result += f"`{text}`"
-    
-    # Handle pre (code blocks)
-    elif tag_name == 'pre':
-        text = clean_text(element.get_text())
-        if text:
-            result += f"```\n{text}\n```\n\n"
-    
-    # Handle tables
-    elif tag_name == 'table':
-        rows = element.find_all('tr')
-        if rows:
-            # Extract headers
-            headers = []
-            header_row = None
-            
-            # Look for headers in thead
-            thead = element.find('thead')
-            if thead:
-                header_row = thead.find('tr')
-            
-            # If no thead, use first row as header
-            if not header_row and rows:
-                header_row = rows[0]
-            
-            if header_row:
-                headers = [clean_text(th.get_text()) for th in header_row.find_all(['th', 'td'])]
-                if all(headers):  # Only use if all headers have content
-                    # Add header row
-                    result += '| ' + ' | '.join(headers) + ' |\n'
-                    # Add separator row
-                    result += '| ' + ' | '.join(['---'] * len(headers)) + ' |\n'
-                    
-                    # Add data rows (skip header row if we're using it as a header)
-                    start_idx = 1 if header_row == rows[0] else 0
-                    for row in rows[start_idx:]:
-                        cells = [clean_text(td.get_text()) for td in row.find_all(['td', 'th'])]
-                        if cells:
-                            # Ensure right number of cells
-                            while len(cells) < len(headers):
-                                cells.append('')
-                            cells = cells[:len(headers)]  # Truncate if too many
-                            
-                            result += '| ' + ' | '.join(cells) + ' |\n'
-                    
-                    result += '\n'
-    
-    # Handle divs and other container elements
-    elif tag_name in ['div', 'section', 'article', 'main', 'header', 'footer', 'nav', 'aside']:
-        # Process all children
-        for child in element.children:
-            result += html_to_markdown(child, base_url, level)
-    
-    # For all other elements, just process children
-    else:
-        for child in element.children:
-            result += html_to_markdown(child, base_url, level)
-    
-    return result
+        # Look for headers in thead
+        thead = element.find('thead')
+        if thead:
+            header_row = thead.find('tr')
+        
+        # If no thead, use first row as header
+        if not header_row and rows:
+            header_row = rows[0]
+        
+        if header_row:
+            headers = [clean_text(th.get_text()) for th in header_row.find_all(['th', 'td'])]
+            if all(headers):  # Only use if all headers have content
+                # Add header row
+                out.append('| ' + ' | '.join(headers) + ' |\n')
+                # Add separator row
+                out.append('| ' + ' | '.join(['---'] * len(headers)) + ' |\n')
+                
+                # Add data rows (skip header row if we're using it as a header)
+                start_idx = 1 if header_row == rows[0] else 0
+                for row in rows[start_idx:]:
+                    cells = [clean_text(td.get_text()) for td in row.find_all(['td', 'th'])]
+                    if cells:
+                        # Ensure right number of cells
+                        while len(cells) < len(headers):
+                            cells.append('')
+                        cells = cells[:len(headers)]  # Truncate if too many
+                        
+                        out.append('| ' + ' | '.join(cells) + ' |\n')
+                
+                out.append('\n')
+
+# Tag name -> markdown handler used by _html_to_markdown
+_MARKDOWN_HANDLERS = {
+    'h1': _emit_heading,
+    'h2': _emit_heading,
+    'h3': _emit_heading,
+    'h4': _emit_heading,
+    'h5': _emit_heading,
+    'h6': _emit_heading,
+    'p': _emit_paragraph,
+    'a': _emit_link,
+    'img': _emit_image,
+    'ul': _emit_unordered_list,
+    'ol': _emit_ordered_list,
+    'blockquote': _emit_blockquote,
+    'code': _emit_code,
+    'pre': _emit_pre,
+    'table': _emit_table,
+}
 
 def convert_full_html_to_markdown(html_content, base_url):
     """Convert full HTML content to clean markdown"""
@@ -515,11 +707,19 @@ def convert_full_html_to_markdown(html_content, base_url):
         # Convert the entire body to markdown
         body_markdown = html_to_markdown(soup.body, base_url)
         
-        # Clean up the markdown
+        # The tree is no longer needed. Its parent/child links form reference
+        # cycles, so tear it down now rather than leaving it for the cycle
+        # collector while other pages are being converted.
+        soup.decompose()
+        
+        # Clean up the markdown. Each pass only runs if it can match, which
+        # on well-formed output the tag pass never does.
         # Remove excess whitespace
-        body_markdown = re.sub(r'\n{3,}', '\n\n', body_markdown)
+        if '\n\n\n' in body_markdown:
+            body_markdown = _EXCESS_NEWLINES_RE.sub('\n\n', body_markdown)
         # Remove any HTML-like artifacts
-        body_markdown = re.sub(r'<[^>]+>', '', body_markdown)
+        if '<' in body_markdown:
+            body_markdown = _TAG_RE.sub('', body_markdown)
         
         markdown += body_markdown
         
@@ -529,66 +729,124 @@ def convert_full_html_to_markdown(html_content, base_url):
         return markdown
     
     except Exception as e:
-        print(f"Error converting HTML to markdown: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error converting HTML to markdown for %s", base_url)
         return f"# Error Processing Content\n\nThere was an error converting content to markdown:\n\n{str(e)}"
 
-def generate_md_files(base_url, urls):
+# Pages fetched at once while generating markdown. The per-host limit in
+# scraper.throttle still caps how many of these reach one site together.
+MD_FETCH_CONCURRENCY = 8
+
+# Markdown conversions of pages that sent an ETag or Last-Modified, with
+# those validators. Re-scrapes send a conditional GET and, on 304, reuse the
+# conversion without downloading or parsing the page again.
+# The cache is bounded by the size of the markdown it holds rather than the
+# entry count: a converted page can run to megabytes, so 2048 of them could
+# take gigabytes in every worker process. Sizes are counted in characters,
+# which is close to bytes for mostly-ASCII markdown.
+MD_CACHE_TTL = 24 * 3600  # seconds
+MD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def _md_cache_entry_size(entry):
+    """Approximate size of a cached (validators, md_file) entry"""
+    return len(entry[1]['content']) + len(entry[1]['filename'])
+
+_md_cache = TTLCache(maxsize=MD_CACHE_MAX_BYTES, ttl=MD_CACHE_TTL, getsizeof=_md_cache_entry_size)
+_md_cache_lock = threading.Lock()
+
+def _generate_md_file(url, pages=None):
+    """
+    Fetch one page and convert it to a markdown file entry
+    
+    Args:
+        url (str): The page to convert
+        pages (dict): Optional pages already fetched, keyed by normalized URL
+        
+    Returns:
+        tuple: (normalized URL, dict with 'filename' and 'content')
+    """
+    try:
+        logger.debug("Generating markdown for: %s", url)
+        
+        # Normalize the URL
+        url = normalize_url(url)
+        
+        # Reuse the page if it was already downloaded, otherwise fetch it
+        # over the shared keep-alive session - conditionally, when an
+        # earlier conversion of it is still cached
+        page = pages.get(url) if pages else None
+        if page is None:
+            with _md_cache_lock:
+                cached = _md_cache.get(url)
+            page = fetch_page(url, headers=cached[0] if cached else None)
+            
+            # Unchanged since the cached conversion - skip parsing entirely
+            if page[0] == 304 and cached:
+                logger.debug("Not modified, reusing markdown for: %s", url)
+                return url, cached[1]
+        status_code, page_html, validators = page
+        
+        if status_code == 200:
+            # Create a clean title for the filename
+            path = urlparse(url).path
+            clean_title = path.replace('/', '-').strip('-')
+            if not clean_title:
+                clean_title = 'index'
+            
+            # Convert HTML to clean markdown
+            md_content = convert_full_html_to_markdown(page_html, url)
+            
+            md_file = {
+                'filename': f"{clean_title}.md",
+                'content': md_content
+            }
+            
+            # Only pages the server can revalidate are worth keeping, and
+            # only if they fit in the cache at all
+            entry = (validators, md_file)
+            if validators and _md_cache_entry_size(entry) <= MD_CACHE_MAX_BYTES:
+                with _md_cache_lock:
+                    _md_cache[url] = entry
+            
+            return url, md_file
+        
+        logger.info("Failed to fetch %s, status code: %s", url, status_code)
+        clean_title = urlparse(url).path.replace('/', '-').strip('-') or 'index'
+        return url, {
+            'filename': f"error-{clean_title}.md",
+            'content': f"# Error\n\nFailed to access {url}: Status code {status_code}"
+        }
+            
+    except Exception as e:
+        logger.exception("Error generating markdown for %s", url)
+        clean_title = urlparse(url).path.replace('/', '-').strip('-') or 'index'
+        return url, {
+            'filename': f"error-{clean_title}.md",
+            'content': f"# Error\n\nFailed to process {url}: {str(e)}"
+        }
+
+def generate_md_files(base_url, urls, pages=None):
     """
     Generate markdown files for each URL with proper conversion from HTML to Markdown
     
+    Pages are fetched up to MD_FETCH_CONCURRENCY at a time; the result keeps
+    the order of urls.
+    
     Args:
         base_url (str): The base URL of the website
         urls (list): List of URLs to generate markdown for
+        pages (dict): Optional pages already fetched (as filled in by
+                      generate_llms_txt), which are not downloaded again
         
     Returns:
         dict: Dictionary with URL as key and markdown content as value
     """
     md_files = {}
+    if not urls:
+        return md_files
     
-    for url in urls:
-        try:
-            print(f"Generating markdown for: {url}")
-            
-            # Normalize the URL
-            url = normalize_url(url)
-            
-            # Send request with appropriate headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            }
-            response = requests.get(url, headers=headers, timeout=15, verify=False)
-            
-            if response.status_code == 200:
-                # Create a clean title for the filename
-                path = urlparse(url).path
-                clean_title = path.replace('/', '-').strip('-')
-                if not clean_title:
-                    clean_title = 'index'
-                
-                # Convert HTML to clean markdown
-                md_content = convert_full_html_to_markdown(response.text, url)
-                
-                # Add to the dictionary
-                md_files[url] = {
-                    'filename': f"{clean_title}.md",
-                    'content': md_content
-                }
-            else:
-                print(f"Failed to fetch {url}, status code: {response.status_code}")
-                clean_title = urlparse(url).path.replace('/', '-').strip('-') or 'index'
-                md_files[url] = {
-                    'filename': f"error-{clean_title}.md",
-                    'content': f"# Error\n\nFailed to access {url}: Status code {response.status_code}"
-                }
-                
-        except Exception as e:
-            print(f"Error generating markdown for {url}: {str(e)}")
-            traceback.print_exc()
-            clean_title = urlparse(url).path.replace('/', '-').strip('-') or 'index'
-            md_files[url] = {
-                'filename': f"error-{clean_title}.md",
-                'content': f"# Error\n\nFailed to process {url}: {str(e)}"
-            }
+    # Page fetches are network-bound, so threads overlap the waits
+    with ThreadPoolExecutor(max_workers=min(MD_FETCH_CONCURRENCY, len(urls))) as executor:
+        for url, md_file in executor.map(lambda url: _generate_md_file(url, pages), urls):
+            md_files[url] = md_file
     
-    return md_files
\ No newline at end of file
+    return md_files
@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+import contextlib
+from urllib.parse import urlsplit
+from cachetools import TTLCache
+from urllib3.util.retry import Retry
+
+# Requests allowed in flight to one host at a time, per worker process.
+# The crawler and the markdown fetches share this budget, so concurrent
+# scrapes of the same site (e.g. a bulk request or several users) can no
+# longer multiply their pools into dozens of simultaneous requests.
+MAX_REQUESTS_PER_HOST = int(os.environ.get('SCRAPE_MAX_REQUESTS_PER_HOST', 4))
+
+# Sustained request rate allowed per host, and how many requests may go out
+# back to back before that rate applies. Replaces a fixed sleep between
+# fetches: fast sites are only slowed once a burst is used up.
+HOST_REQUESTS_PER_SECOND = float(os.environ.get('SCRAPE_HOST_RATE', 5))
+HOST_BURST = int(os.environ.get('SCRAPE_HOST_BURST', 10))
+
+# Longest Retry-After honoured on a 429/503. Shorter waits are respected so
+# a site asking us to slow down actually gets the pause it asked for, but a
+# huge value cannot park a worker (and a host slot) indefinitely.
+MAX_RETRY_AFTER = float(os.environ.get('SCRAPE_MAX_RETRY_AFTER', 10))
+
+class CappedRetry(Retry):
+    """urllib3 Retry that honours Retry-After up to MAX_RETRY_AFTER seconds"""
+    
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+class TokenBucket:
+    """Allows bursts of up to `burst` calls, then `rate` calls per second"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping only when the bucket is empty"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token up front; a negative balance is the queue of
+            # callers already waiting, so each one sleeps its own share
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class HostRateLimiter:
+    """One TokenBucket per host, created on first use"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        # Idle hosts are dropped after an hour, by which time their bucket
+        # would be full again anyway
+        self._buckets = TTLCache(maxsize=4096, ttl=3600)
+        self._lock = threading.Lock()
+    
+    def acquire(self, host):
+        """Wait until a request to `host` is allowed"""
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[host] = bucket
+        bucket.acquire()
+
+RATE_LIMITER = HostRateLimiter(HOST_REQUESTS_PER_SECOND, HOST_BURST)
+
+# One semaphore per host. Entries idle for an hour are dropped so a long
+# bulk run over many sites does not grow this forever.
+_host_semaphores = TTLCache(maxsize=4096, ttl=3600)
+_host_semaphores_lock = threading.Lock()
+
+def _host_semaphore(host):
+    """Return the shared semaphore for a host, creating it on first use"""
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        # Re-store on every use to keep busy hosts from expiring
+        _host_semaphores[host] = semaphore
+        return semaphore
+
+@contextlib.contextmanager
+def host_slot(url):
+    """
+    Wait for the host's rate limit, then hold one of its request slots for
+    the duration of a fetch
+
+    Args:
+        url (str): The URL about to be fetched
+    """
+    host = urlsplit(url).hostname or ''
+    # Wait for a token before taking a slot, so rate-limited callers don't
+    # sit on slots other fetches could be using
+    RATE_LIMITER.acquire(host)
+    with _host_semaphore(host):
+        yield